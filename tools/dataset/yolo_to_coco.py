@@ -8,84 +8,227 @@ COCO format: x_min y_min width height (absolute pixels)
 import os
 import json
 import argparse
-import random
 import shutil
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
+import numpy as np
 from PIL import Image
 from tqdm import tqdm
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+
 
 def read_class_names(label_list_file):
     """Read class names from label_list.txt"""
     with open(label_list_file, 'r') as f:
-        classes = [line.strip() for line in f.readlines() if line.strip()]
+        classes = [name for name in (line.strip() for line in f) if name]
     return classes
 
 
-def yolo_to_coco_bbox(yolo_bbox, img_width, img_height):
+def save_coco_json(coco, json_path):
+    """Write COCO dict to disk, using orjson when available"""
+    if orjson is not None:
+        Path(json_path).write_bytes(
+            orjson.dumps(coco, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+        return
+    
+    with open(json_path, 'w') as f:
+        json.dump(coco, f, indent=2)
+
+
+def yolo_to_coco_bbox(yolo_bboxes, img_width, img_height):
     """
-    Convert YOLO bbox (normalized cxcywh) to COCO bbox (absolute xywh)
+    Convert YOLO bboxes (normalized cxcywh) to COCO bboxes (absolute xywh)
     
     Args:
-        yolo_bbox: [cx, cy, w, h] normalized (0-1)
+        yolo_bboxes: (N, 4) array of [cx, cy, w, h] normalized (0-1)
         img_width: image width in pixels
         img_height: image height in pixels
     
     Returns:
-        [x, y, w, h] in absolute pixels
+        Tuple of ((N, 4) array of [x, y, w, h] in absolute pixels, (N,) array of areas)
     """
-    cx, cy, w, h = yolo_bbox
+    size = np.array([img_width, img_height], dtype=np.float64)
     
     # Convert normalized to absolute
-    cx_abs = cx * img_width
-    cy_abs = cy * img_height
-    w_abs = w * img_width
-    h_abs = h * img_height
+    abs_bboxes = yolo_bboxes * np.tile(size, 2)
     
     # Convert center to top-left
-    x = cx_abs - w_abs / 2
-    y = cy_abs - h_abs / 2
+    xy = abs_bboxes[:, :2] - abs_bboxes[:, 2:] / 2
     
     # Ensure bbox is within image bounds
-    x = max(0, min(x, img_width - 1))
-    y = max(0, min(y, img_height - 1))
-    w_abs = min(w_abs, img_width - x)
-    h_abs = min(h_abs, img_height - y)
+    xy = np.clip(xy, 0, size - 1)
+    wh = np.minimum(abs_bboxes[:, 2:], size - xy)
     
-    return [x, y, w_abs, h_abs]
+    area = wh[:, 0] * wh[:, 1]
+    return np.concatenate([xy, wh], axis=1), area
 
 
 def parse_yolo_label(label_file):
-    """Parse YOLO format label file"""
-    annotations = []
+    """
+    Parse YOLO format label file
+    
+    Returns:
+        Tuple of ((N,) int32 array of class ids, (N, 4) array of normalized cxcywh bboxes)
+    """
+    empty = np.empty((0,), dtype=np.int32), np.empty((0, 4), dtype=np.float64)
     if not os.path.exists(label_file):
-        return annotations
-    
-    with open(label_file, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            
-            parts = line.split()
-            if len(parts) < 5:
-                continue
-            
-            class_id = int(parts[0])
-            cx = float(parts[1])
-            cy = float(parts[2])
-            w = float(parts[3])
-            h = float(parts[4])
-            
-            annotations.append({
-                'class_id': class_id,
-                'bbox': [cx, cy, w, h]
-            })
-    
-    return annotations
+        return empty
+    
+    try:
+        with warnings.catch_warnings():
+            # Empty label files (images without objects) are expected
+            warnings.simplefilter('ignore', UserWarning)
+            labels = np.loadtxt(label_file, dtype=np.float64, ndmin=2, usecols=range(5))
+    except ValueError as e:
+        print(f"Warning: Malformed label file {label_file} ({e}), skipping")
+        return empty
+    
+    return labels[:, 0].astype(np.int32), labels[:, 1:5]
+
 
+def _reflink(src, dst):
+    """Copy src to dst with copy_file_range, letting the filesystem share extents when it can"""
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        remaining = os.fstat(fsrc.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+            if copied == 0:
+                break
+            remaining -= copied
 
-def convert_dataset(yolo_images_dir, yolo_labels_dir, label_list_file, output_dir, train_ratio=0.9, seed=42):
+
+def _place(src, dst, mode='copy'):
+    """
+    Place an image file at dst
+    
+    Args:
+        src: Source image path
+        dst: Destination path
+        mode: One of 'copy', 'hardlink', 'symlink', 'reflink'. Modes that cannot be
+            satisfied (e.g. hardlink across devices) fall back to a regular copy.
+    """
+    # Clear leftovers from a previous run: links cannot overwrite, and copying onto
+    # a link to src would fail (or truncate the source). Never remove src itself.
+    if os.path.lexists(dst) and (os.path.islink(dst) or os.path.realpath(dst) != os.path.realpath(src)):
+        os.remove(dst)
+    
+    if mode == 'copy':
+        shutil.copy2(src, dst)
+        return
+    
+    try:
+        if mode == 'hardlink':
+            os.link(src, dst)
+        elif mode == 'symlink':
+            os.symlink(os.path.abspath(src), dst)
+        elif mode == 'reflink':
+            if hasattr(os, 'copy_file_range'):
+                _reflink(src, dst)
+            else:
+                shutil.copyfile(src, dst)
+        else:
+            raise ValueError(f"Unknown link mode: {mode}")
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _process_image(img_path, yolo_labels_dir, out_images_dir, num_classes, link_mode='copy'):
+    """
+    Convert a single image and its YOLO labels, placing the image in out_images_dir.
+    Runs in a worker process, so ids are assigned by the caller.
+    
+    Returns:
+        Tuple of (image entry, list of annotation entries), both without ids
+    """
+    # Only the header is parsed; close the handle right away
+    with Image.open(img_path) as img:
+        img_width, img_height = img.size
+    
+    # Get corresponding label file
+    label_file = Path(yolo_labels_dir) / (img_path.stem + '.txt')
+    class_ids, yolo_bboxes = parse_yolo_label(label_file)
+    
+    # Drop annotations with out-of-range class ids
+    valid = (class_ids >= 0) & (class_ids < num_classes)
+    for class_id in class_ids[~valid]:
+        print(f"Warning: Invalid class_id {class_id} in {label_file}, skipping")
+    
+    # Convert all bboxes of this image at once
+    coco_bboxes, areas = yolo_to_coco_bbox(yolo_bboxes[valid], img_width, img_height)
+    category_ids = class_ids[valid] + 1  # COCO uses 1-indexed categories
+    
+    image = {
+        'file_name': img_path.name,
+        'width': img_width,
+        'height': img_height
+    }
+    annotations = [
+        {
+            'category_id': category_id,
+            'bbox': bbox,
+            'area': area,
+            'iscrowd': 0
+        }
+        for category_id, bbox, area in zip(category_ids.tolist(), coco_bboxes.tolist(), areas.tolist())
+    ]
+    
+    # Copy (or link) image to output directory
+    _place(img_path, os.path.join(out_images_dir, img_path.name), link_mode)
+    
+    return image, annotations
+
+
+def convert_split(image_files, yolo_labels_dir, out_images_dir, categories, desc, num_workers=None,
+                  link_mode='copy'):
+    """
+    Convert one split of the dataset using a pool of worker processes
+    
+    Args:
+        image_files: List of image paths belonging to the split
+        yolo_labels_dir: Directory containing YOLO format labels
+        out_images_dir: Directory the split's images are copied to
+        categories: COCO categories list, shared between splits
+        desc: Progress bar description
+        num_workers: Number of worker processes (default: CPU count)
+        link_mode: How images are placed in out_images_dir (see _place)
+    
+    Returns:
+        COCO format dict for the split
+    """
+    coco = {
+        'images': [],
+        'annotations': [],
+        'categories': categories
+    }
+    
+    worker = partial(_process_image, yolo_labels_dir=yolo_labels_dir,
+                     out_images_dir=out_images_dir, num_classes=len(categories), link_mode=link_mode)
+    
+    # Results come back in input order, so ids stay deterministic
+    ann_id = 1
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        results = executor.map(worker, image_files, chunksize=32)
+        for image_id, (image, annotations) in enumerate(
+                tqdm(results, total=len(image_files), desc=desc), start=1):
+            coco['images'].append({'id': image_id, **image})
+            for ann in annotations:
+                coco['annotations'].append({'id': ann_id, 'image_id': image_id, **ann})
+                ann_id += 1
+    
+    return coco
+
+
+def convert_dataset(yolo_images_dir, yolo_labels_dir, label_list_file, output_dir, train_ratio=0.9, seed=42,
+                    num_workers=None, link_mode='copy'):
     """
     Convert YOLO format dataset to COCO format
     
@@ -96,6 +239,8 @@ def convert_dataset(yolo_images_dir, yolo_labels_dir, label_list_file, output_di
         output_dir: Output directory for COCO format dataset
         train_ratio: Ratio of training data (default 0.9 for 90/10 split)
         seed: Random seed for train/val split
+        num_workers: Number of worker processes (default: CPU count)
+        link_mode: How images are placed in the output directory: copy, hardlink, symlink or reflink
     """
     # Read class names
     classes = read_class_names(label_list_file)
@@ -111,135 +256,43 @@ def convert_dataset(yolo_images_dir, yolo_labels_dir, label_list_file, output_di
     for dir_path in [train_images_dir, train_annotations_dir, val_images_dir, val_annotations_dir]:
         os.makedirs(dir_path, exist_ok=True)
     
-    # Get all image files
-    image_files = []
-    for ext in ['.jpg', '.jpeg', '.png', '.JPG', '.JPEG', '.PNG']:
-        image_files.extend(Path(yolo_images_dir).glob(f'*{ext}'))
+    # Placing images would overwrite (or remove) the source images themselves
+    for images_dir in [train_images_dir, val_images_dir]:
+        if os.path.samefile(yolo_images_dir, images_dir):
+            raise ValueError(f"Output images directory {images_dir} is the input images directory")
     
-    image_files = sorted(image_files)
+    # Get all image files in a single directory pass
+    with os.scandir(yolo_images_dir) as it:
+        image_names = sorted(
+            entry.name for entry in it
+            if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS
+        )
+    image_files = tuple(Path(yolo_images_dir) / name for name in image_names)
     print(f"Found {len(image_files)} images")
     
-    # Shuffle and split
-    random.seed(seed)
-    random.shuffle(image_files)
+    # Shuffle indices rather than paths and split the permutation
+    rng = np.random.default_rng(seed)
+    perm = rng.permutation(len(image_files))
     
     split_idx = int(len(image_files) * train_ratio)
-    train_images = image_files[:split_idx]
-    val_images = image_files[split_idx:]
+    train_images = [image_files[i] for i in perm[:split_idx]]
+    val_images = [image_files[i] for i in perm[split_idx:]]
     
     print(f"Train images: {len(train_images)}, Val images: {len(val_images)}")
     
-    # Convert train set
-    train_coco = {
-        'images': [],
-        'annotations': [],
-        'categories': [{'id': i + 1, 'name': name} for i, name in enumerate(classes)]
-    }
-    
-    ann_id = 1
-    for img_path in tqdm(train_images, desc="Converting train set"):
-        img = Image.open(img_path)
-        img_width, img_height = img.size
-        
-        # Get corresponding label file
-        label_file = Path(yolo_labels_dir) / (img_path.stem + '.txt')
-        yolo_annotations = parse_yolo_label(label_file)
-        
-        # Add image entry
-        image_id = len(train_coco['images']) + 1
-        train_coco['images'].append({
-            'id': image_id,
-            'file_name': img_path.name,
-            'width': img_width,
-            'height': img_height
-        })
-        
-        # Add annotations
-        for yolo_ann in yolo_annotations:
-            class_id = yolo_ann['class_id']
-            if class_id < 0 or class_id >= num_classes:
-                print(f"Warning: Invalid class_id {class_id} in {label_file}, skipping")
-                continue
-            
-            # Convert bbox
-            coco_bbox = yolo_to_coco_bbox(yolo_ann['bbox'], img_width, img_height)
-            
-            # Calculate area
-            area = coco_bbox[2] * coco_bbox[3]
-            
-            train_coco['annotations'].append({
-                'id': ann_id,
-                'image_id': image_id,
-                'category_id': class_id + 1,  # COCO uses 1-indexed categories
-                'bbox': coco_bbox,
-                'area': area,
-                'iscrowd': 0
-            })
-            ann_id += 1
-        
-        # Copy image to train directory
-        shutil.copy2(img_path, os.path.join(train_images_dir, img_path.name))
-    
-    # Convert val set
-    val_coco = {
-        'images': [],
-        'annotations': [],
-        'categories': [{'id': i + 1, 'name': name} for i, name in enumerate(classes)]
-    }
-    
-    ann_id = 1
-    for img_path in tqdm(val_images, desc="Converting val set"):
-        img = Image.open(img_path)
-        img_width, img_height = img.size
-        
-        # Get corresponding label file
-        label_file = Path(yolo_labels_dir) / (img_path.stem + '.txt')
-        yolo_annotations = parse_yolo_label(label_file)
-        
-        # Add image entry
-        image_id = len(val_coco['images']) + 1
-        val_coco['images'].append({
-            'id': image_id,
-            'file_name': img_path.name,
-            'width': img_width,
-            'height': img_height
-        })
-        
-        # Add annotations
-        for yolo_ann in yolo_annotations:
-            class_id = yolo_ann['class_id']
-            if class_id < 0 or class_id >= num_classes:
-                print(f"Warning: Invalid class_id {class_id} in {label_file}, skipping")
-                continue
-            
-            # Convert bbox
-            coco_bbox = yolo_to_coco_bbox(yolo_ann['bbox'], img_width, img_height)
-            
-            # Calculate area
-            area = coco_bbox[2] * coco_bbox[3]
-            
-            val_coco['annotations'].append({
-                'id': ann_id,
-                'image_id': image_id,
-                'category_id': class_id + 1,  # COCO uses 1-indexed categories
-                'bbox': coco_bbox,
-                'area': area,
-                'iscrowd': 0
-            })
-            ann_id += 1
-        
-        # Copy image to val directory
-        shutil.copy2(img_path, os.path.join(val_images_dir, img_path.name))
+    # Convert train and val sets
+    categories = [{'id': i + 1, 'name': name} for i, name in enumerate(classes)]
+    train_coco = convert_split(train_images, yolo_labels_dir, train_images_dir, categories,
+                               "Converting train set", num_workers, link_mode)
+    val_coco = convert_split(val_images, yolo_labels_dir, val_images_dir, categories,
+                             "Converting val set", num_workers, link_mode)
     
     # Save COCO JSON files
     train_json_path = os.path.join(train_annotations_dir, 'instances_train.json')
     val_json_path = os.path.join(val_annotations_dir, 'instances_val.json')
     
-    with open(train_json_path, 'w') as f:
-        json.dump(train_coco, f, indent=2)
-    
-    with open(val_json_path, 'w') as f:
-        json.dump(val_coco, f, indent=2)
+    save_coco_json(train_coco, train_json_path)
+    save_coco_json(val_coco, val_json_path)
     
     print(f"\nConversion complete!")
     print(f"Train annotations: {train_json_path}")
@@ -264,6 +317,11 @@ def main():
                         help='Ratio of training data (default: 0.9 for 90/10 split)')
     parser.add_argument('--seed', type=int, default=42,
                         help='Random seed for train/val split (default: 42)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--link', type=str, default='copy',
+                        choices=['copy', 'hardlink', 'symlink', 'reflink'],
+                        help='How images are placed in the output directory (default: copy)')
     
     args = parser.parse_args()
     
@@ -273,7 +331,9 @@ def main():
         args.label_list,
         args.output_dir,
         args.train_ratio,
-        args.seed
+        args.seed,
+        args.workers,
+        args.link
     )
 
 
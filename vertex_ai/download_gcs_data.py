@@ -4,14 +4,46 @@ Download data from Google Cloud Storage to local directory.
 Replaces gsutil CLI with Python implementation.
 """
 
+import argparse
+import asyncio
+import base64
+import hashlib
 import os
+import stat
 import sys
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import namedtuple
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from threading import BoundedSemaphore
+import requests
+from google.auth.exceptions import DefaultCredentialsError
 from google.cloud import storage
+from google.cloud.storage import transfer_manager
 from google.cloud.exceptions import NotFound
 from tqdm import tqdm
 
+# Blobs above this size are downloaded as concurrent chunks
+LARGE_BLOB_SIZE = 64 * 1024 * 1024
+CHUNK_SIZE = 16 * 1024 * 1024
+
+# Number of blobs per listing page
+LIST_PAGE_SIZE = 1000
+
+# Concurrent requests per worker in --async mode
+ASYNC_REQUESTS_PER_WORKER = 16
+
+# Seconds to open a connection and between two reads of a body in --async mode
+ASYNC_CONNECT_TIMEOUT = 30
+ASYNC_READ_TIMEOUT = 60
+
+# Body bytes buffered per file write in --async mode
+ASYNC_WRITE_SIZE = 1024 * 1024
+
+# Listing entry of the JSON API, exposing the Blob attributes the helpers use
+BlobInfo = namedtuple('BlobInfo', ['name', 'size', 'md5_hash', 'content_encoding'])
+
 
 def parse_gcs_path(gcs_path: str) -> tuple[str, str]:
     """Parse GCS path into bucket and prefix.
@@ -42,8 +74,40 @@ def parse_gcs_path(gcs_path: str) -> tuple[str, str]:
     return bucket_name, prefix
 
 
-def download_blob(blob, local_base_path: Path, prefix: str) -> str:
-    """Download a single blob to local filesystem.
+def create_storage_client(max_workers: int) -> storage.Client:
+    """Create a GCS client whose HTTP connection pool fits the download threads.
+
+    The default requests pool keeps 10 connections per host, so more concurrent
+    requests would keep opening and discarding TLS connections. Falls back to an
+    anonymous client (public buckets only) when no credentials are available.
+
+    Args:
+        max_workers: Number of parallel download threads
+
+    Returns:
+        GCS client
+    """
+    try:
+        client = storage.Client()
+    except DefaultCredentialsError:
+        print("No Google Cloud credentials found, using anonymous client")
+        client = storage.Client.create_anonymous_client()
+
+    # Concurrent requests on the session: max_workers small-blob threads, the chunk
+    # threads of the large-blob download and the main thread listing pages
+    pool_size = 2 * max_workers + 1
+
+    # The client exposes no public way to size its pool, so remount the adapter on
+    # its private requests session. Only replace the stock adapter: google-auth may
+    # have mounted an mTLS adapter there, which must be kept.
+    session = client._http
+    if type(session.adapters.get("https://")) is requests.adapters.HTTPAdapter:
+        session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+    return client
+
+
+def local_blob_path(blob, local_base_path: Path, prefix: str) -> Optional[Path]:
+    """Map a blob to its local destination path.
 
     Args:
         blob: GCS blob object
@@ -51,7 +115,7 @@ def download_blob(blob, local_base_path: Path, prefix: str) -> str:
         prefix: GCS prefix to strip from blob name
 
     Returns:
-        Local file path where blob was downloaded
+        Local file path for the blob, or None for directory markers
     """
     # Calculate relative path by removing prefix
     relative_path = blob.name
@@ -62,32 +126,158 @@ def download_blob(blob, local_base_path: Path, prefix: str) -> str:
     if not relative_path:
         return None
 
-    local_path = local_base_path / relative_path
+    return local_base_path / relative_path
 
-    # Create parent directories if needed
-    local_path.parent.mkdir(parents=True, exist_ok=True)
 
-    # Download the blob
-    blob.download_to_filename(str(local_path))
-    return str(local_path)
+def create_parent_dirs(paths, created_dirs: Optional[set] = None):
+    """Create the parent directories of all paths, once per unique directory.
 
+    Args:
+        paths: Iterable of local file paths
+        created_dirs: Directories already created by earlier calls, updated in place
+    """
+    if created_dirs is None:
+        created_dirs = set()
 
-def download_gcs_directory(gcs_path: str, local_path: str = 'data', max_workers: int = 10):
-    """Download all files from a GCS path to local directory.
+    # Shallow directories first, so deeper ones only create their last component
+    new_dirs = {path.parent for path in paths} - created_dirs
+    for directory in sorted(new_dirs, key=lambda p: len(p.parts)):
+        directory.mkdir(parents=True, exist_ok=True)
+    created_dirs.update(new_dirs)
+
+
+def list_directory(path: Path, limit: int = 20):
+    """Print the first entries of a directory, similar to `ls -la`.
 
     Args:
-        gcs_path: GCS path like gs://bucket/path/to/data/*
-        local_path: Local directory to download to (default: 'data')
-        max_workers: Number of parallel download threads
+        path: Directory to list
+        limit: Maximum number of entries to print
     """
-    print(f"Downloading from GCS: {gcs_path}")
+    with os.scandir(path) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
 
-    # Parse GCS path
-    bucket_name, prefix = parse_gcs_path(gcs_path)
-    print(f"Bucket: {bucket_name}, Prefix: {prefix or '(root)'}")
+    for entry in entries[:limit]:
+        st = entry.stat(follow_symlinks=False)
+        print(f"{stat.filemode(st.st_mode)} {st.st_size:>10} {entry.name}")
+    if len(entries) > limit:
+        print(f"... and {len(entries) - limit} more")
+
+
+def is_downloaded(blob, local_path: Path, verify: bool = False) -> bool:
+    """Check whether a blob is already present locally, e.g. from an earlier run.
+
+    gzip-encoded blobs are stored decompressed, so their size and MD5 (which
+    describe the compressed object) cannot match the local file. For those, an
+    existing file counts as present: downloads only reach local_path once they
+    have completed (see partial_path), even with verify.
+
+    Args:
+        blob: GCS blob object
+        local_path: Local destination path
+        verify: Also compare the MD5 checksum instead of only the size
+
+    Returns:
+        True if the local file matches the blob
+    """
+    try:
+        local_size = local_path.stat().st_size
+    except FileNotFoundError:
+        return False
+
+    if blob.content_encoding == 'gzip':
+        return True
+
+    if local_size != blob.size:
+        return False
+
+    if not verify:
+        return True
+
+    # Composite objects carry no MD5, download them again to be safe
+    if not blob.md5_hash:
+        return False
+
+    md5 = hashlib.md5()
+    with open(local_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(chunk)
+    return md5.digest() == base64.b64decode(blob.md5_hash)
+
+
+def partial_path(local_path: Path) -> Path:
+    """Temporary path a blob is written to until its download has completed.
+
+    Writing in place could leave a truncated or zero-filled file with the full
+    size behind, which a later run would then skip as already downloaded.
+
+    Args:
+        local_path: Local destination path
+
+    Returns:
+        Path of the partial download next to local_path
+    """
+    return local_path.with_name(local_path.name + '.part')
 
+
+def download_blob(blob, local_path: Path, max_workers: int, verify: bool = False) -> bool:
+    """Download a single blob to its local path, unless it is already present.
+
+    Blobs larger than LARGE_BLOB_SIZE are split into chunks that are downloaded
+    concurrently by transfer_manager.
+
+    Args:
+        blob: GCS blob object
+        local_path: Local destination path
+        max_workers: Number of threads used for the chunks of a large blob
+        verify: Compare MD5 checksums of present files before skipping them
+
+    Returns:
+        True if the blob was downloaded, False if it was skipped
+    """
+    if is_downloaded(blob, local_path, verify):
+        return False
+
+    part_path = partial_path(local_path)
+    try:
+        if (blob.size or 0) > LARGE_BLOB_SIZE:
+            # Download as concurrent, checksummed chunks
+            transfer_manager.download_chunks_concurrently(
+                blob,
+                str(part_path),
+                chunk_size=CHUNK_SIZE,
+                max_workers=max_workers,
+                worker_type=transfer_manager.THREAD,
+            )
+        else:
+            blob.download_to_filename(str(part_path))
+    except Exception:
+        part_path.unlink(missing_ok=True)
+        raise
+
+    os.replace(part_path, local_path)
+    return True
+
+
+def download_blobs(bucket_name: str, prefix: str, local_base_path: Path, max_workers: int,
+                   verify: bool = False) -> tuple[int, list[str], list[str], list[str]]:
+    """Download all blobs under a prefix with worker threads.
+
+    Each blob is submitted as soon as its listing page arrives, so downloads start
+    before the listing is complete and a slow blob never holds back the others.
+    Large blobs run on their own thread, next to the small ones.
+
+    Args:
+        bucket_name: GCS bucket name
+        prefix: GCS prefix to download
+        local_base_path: Base local directory path
+        max_workers: Number of parallel download threads
+        verify: Compare MD5 checksums of present files before skipping them
+
+    Returns:
+        Tuple of (number of listed objects, downloaded local files, skipped local files, names of failed blobs)
+    """
     # Initialize GCS client
-    client = storage.Client()
+    client = create_storage_client(max_workers)
 
     try:
         bucket = client.bucket(bucket_name)
@@ -95,47 +285,224 @@ def download_gcs_directory(gcs_path: str, local_path: str = 'data', max_workers:
         print(f"Error: Bucket '{bucket_name}' not found")
         sys.exit(1)
 
-    # List all blobs with the prefix
-    blobs = list(bucket.list_blobs(prefix=prefix))
+    num_objects = 0
+    downloaded_files = []
+    skipped_files = []
+    failed_downloads = []
+    created_dirs = set()
+
+    # Caps queued small-blob downloads, so memory stays flat while listing
+    small_slots = BoundedSemaphore(max_workers * 4)
+
+    def on_done(future, blob, local_path):
+        try:
+            if future.result():
+                downloaded_files.append(str(local_path))
+            else:
+                skipped_files.append(str(local_path))
+        except Exception as e:
+            print(f"\nError downloading {blob.name}: {e}")
+            failed_downloads.append(blob.name)
+        finally:
+            if (blob.size or 0) <= LARGE_BLOB_SIZE:
+                small_slots.release()
+            pbar.update(1)
+
+    # The progress bar is opened first so it only closes after both pools have drained
+    with tqdm(desc="Downloading files", unit="file") as pbar, \
+            ThreadPoolExecutor(max_workers=max_workers) as small_pool, \
+            ThreadPoolExecutor(max_workers=1) as large_pool:
+        for page in bucket.list_blobs(prefix=prefix, page_size=LIST_PAGE_SIZE).pages:
+            # Resolve destinations, skipping directory markers
+            blob_paths = []
+            for blob in page:
+                num_objects += 1
+                path = local_blob_path(blob, local_base_path, prefix)
+                if path is not None:
+                    blob_paths.append((blob, path))
+
+            create_parent_dirs((path for _, path in blob_paths), created_dirs)
+
+            for blob, path in blob_paths:
+                if (blob.size or 0) > LARGE_BLOB_SIZE:
+                    future = large_pool.submit(download_blob, blob, path, max_workers, verify)
+                else:
+                    small_slots.acquire()
+                    future = small_pool.submit(download_blob, blob, path, max_workers, verify)
+                future.add_done_callback(partial(on_done, blob=blob, local_path=path))
+
+    return num_objects, downloaded_files, skipped_files, failed_downloads
+
+
+async def download_blobs_async(bucket_name: str, prefix: str, local_base_path: Path, max_workers: int,
+                               verify: bool = False) -> tuple[int, list[str], list[str], list[str]]:
+    """Download all blobs under a prefix on a single asyncio event loop.
+
+    Meant for many small files: up to max_workers * ASYNC_REQUESTS_PER_WORKER
+    streamed requests share one pooled aiohttp session instead of a thread each.
+    Only networking runs on the event loop; file system work (stat, hashing,
+    writes, renames, mkdir) is handed to worker threads, with body chunks
+    buffered up to ASYNC_WRITE_SIZE per write. Requires the optional
+    gcloud-aio-storage package.
 
-    if not blobs:
-        print(f"Warning: No objects found at {gcs_path}")
-        return
+    Args:
+        bucket_name: GCS bucket name
+        prefix: GCS prefix to download
+        local_base_path: Base local directory path
+        max_workers: Number of parallel download threads the concurrency is scaled from
+        verify: Compare MD5 checksums of present files before skipping them
 
-    print(f"Found {len(blobs)} objects to download")
+    Returns:
+        Tuple of (number of listed objects, downloaded local files, skipped local files, names of failed blobs)
+    """
+    import aiohttp
+    from gcloud.aio.storage import Storage
 
-    # Create local directory
-    local_base_path = Path(local_path)
-    local_base_path.mkdir(parents=True, exist_ok=True)
+    max_in_flight = max_workers * ASYNC_REQUESTS_PER_WORKER
+    in_flight = asyncio.Semaphore(max_in_flight)
+
+    # Streams share bandwidth, so bodies may take arbitrarily long; only fail
+    # connections that cannot be opened or that stall
+    stream_timeout = aiohttp.ClientTimeout(total=None, sock_connect=ASYNC_CONNECT_TIMEOUT,
+                                           sock_read=ASYNC_READ_TIMEOUT)
 
-    # Download blobs in parallel
+    num_objects = 0
     downloaded_files = []
+    skipped_files = []
     failed_downloads = []
-
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all download tasks
-        future_to_blob = {
-            executor.submit(download_blob, blob, local_base_path, prefix): blob
-            for blob in blobs
-        }
-
-        # Process completed downloads with progress bar
-        with tqdm(total=len(blobs), desc="Downloading files") as pbar:
-            for future in as_completed(future_to_blob):
-                blob = future_to_blob[future]
+    created_dirs = set()
+    tasks = set()
+
+    def write_chunk(f, md5, data):
+        f.write(data)
+        md5.update(data)
+
+    async def fetch(client, blob, local_path):
+        try:
+            if await asyncio.to_thread(is_downloaded, blob, local_path, verify):
+                skipped_files.append(str(local_path))
+                return
+
+            part_path = partial_path(local_path)
+            try:
+                num_bytes = 0
+                md5 = hashlib.md5()
+                buffer = bytearray()
+                stream = await client.download_stream(bucket_name, blob.name, timeout=stream_timeout)
+                f = await asyncio.to_thread(open, part_path, 'wb')
                 try:
-                    local_file = future.result()
-                    if local_file:  # Skip None results (directory markers)
-                        downloaded_files.append(local_file)
-                except Exception as e:
-                    print(f"\nError downloading {blob.name}: {e}")
-                    failed_downloads.append(blob.name)
+                    async with stream:
+                        while chunk := await stream.read(ASYNC_WRITE_SIZE):
+                            num_bytes += len(chunk)
+                            buffer += chunk
+                            if len(buffer) >= ASYNC_WRITE_SIZE:
+                                await asyncio.to_thread(write_chunk, f, md5, buffer)
+                                buffer.clear()
+                    if buffer:
+                        await asyncio.to_thread(write_chunk, f, md5, buffer)
                 finally:
-                    pbar.update(1)
+                    await asyncio.to_thread(f.close)
+
+                # Size and MD5 describe the stored bytes, which gzip-encoded objects
+                # are transparently decompressed from, so only check the others
+                if blob.content_encoding != 'gzip':
+                    if num_bytes != blob.size:
+                        raise IOError(f"Incomplete download: got {num_bytes} of {blob.size} bytes")
+                    if blob.md5_hash and md5.digest() != base64.b64decode(blob.md5_hash):
+                        raise IOError("MD5 checksum mismatch")
+            except Exception:
+                await asyncio.to_thread(part_path.unlink, missing_ok=True)
+                raise
+
+            await asyncio.to_thread(os.replace, part_path, local_path)
+            downloaded_files.append(str(local_path))
+        except Exception as e:
+            print(f"\nError downloading {blob.name}: {e}")
+            failed_downloads.append(blob.name)
+        finally:
+            in_flight.release()
+            pbar.update(1)
+
+    connector = aiohttp.TCPConnector(limit=max_in_flight)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        client = Storage(session=session)
+        params = {'prefix': prefix, 'maxResults': str(LIST_PAGE_SIZE)}
+
+        with tqdm(desc="Downloading files", unit="file") as pbar:
+            while True:
+                page = await client.list_objects(bucket_name, params=params)
+
+                # Resolve destinations, skipping directory markers
+                blob_paths = []
+                for item in page.get('items', []):
+                    num_objects += 1
+                    blob = BlobInfo(item['name'], int(item['size']), item.get('md5Hash'),
+                                    item.get('contentEncoding'))
+                    path = local_blob_path(blob, local_base_path, prefix)
+                    if path is not None:
+                        blob_paths.append((blob, path))
+
+                await asyncio.to_thread(create_parent_dirs, [path for _, path in blob_paths], created_dirs)
+
+                for blob, path in blob_paths:
+                    # Wait for a free slot, so the number of pending tasks stays bounded
+                    await in_flight.acquire()
+                    task = asyncio.create_task(fetch(client, blob, path))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+
+                if 'nextPageToken' not in page:
+                    break
+                params['pageToken'] = page['nextPageToken']
+
+            await asyncio.gather(*tasks)
+
+    return num_objects, downloaded_files, skipped_files, failed_downloads
+
+
+def download_gcs_directory(gcs_path: str, local_path: str = 'data', max_workers: int = 10,
+                           verify: bool = False, use_async: bool = False):
+    """Download all files from a GCS path to local directory.
+
+    Args:
+        gcs_path: GCS path like gs://bucket/path/to/data/*
+        local_path: Local directory to download to (default: 'data')
+        max_workers: Number of parallel download threads
+        verify: Compare MD5 checksums of files present from a previous run before skipping them
+        use_async: Download on an asyncio event loop (needs gcloud-aio-storage)
+    """
+    print(f"Downloading from GCS: {gcs_path}")
+
+    # Parse GCS path
+    bucket_name, prefix = parse_gcs_path(gcs_path)
+    print(f"Bucket: {bucket_name}, Prefix: {prefix or '(root)'}")
+
+    # Create local directory
+    local_base_path = Path(local_path)
+    local_base_path.mkdir(parents=True, exist_ok=True)
+
+    if use_async:
+        try:
+            import gcloud.aio.storage  # noqa: F401
+        except ImportError:
+            print("Error: --async requires gcloud-aio-storage (pip install gcloud-aio-storage)")
+            sys.exit(1)
+        results = asyncio.run(download_blobs_async(bucket_name, prefix, local_base_path, max_workers, verify))
+    else:
+        results = download_blobs(bucket_name, prefix, local_base_path, max_workers, verify)
+    num_objects, downloaded_files, skipped_files, failed_downloads = results
+
+    if not num_objects:
+        print(f"Warning: No objects found at {gcs_path}")
+        return
+
+    print(f"Found {num_objects} objects")
 
     # Print summary
     print(f"\nDownload complete!")
     print(f"Successfully downloaded: {len(downloaded_files)} files")
+    if skipped_files:
+        print(f"Already present, skipped: {len(skipped_files)} files")
     if failed_downloads:
         print(f"Failed downloads: {len(failed_downloads)} files")
         for failed in failed_downloads[:5]:  # Show first 5 failures
@@ -145,11 +512,18 @@ def download_gcs_directory(gcs_path: str, local_path: str = 'data', max_workers:
 
     # List downloaded directory structure
     print(f"\nDownloaded to {local_path}/:")
-    os.system(f"ls -la {local_path}/ | head -20")
+    list_directory(local_base_path)
 
 
 def main():
     """Main entry point for standalone script usage."""
+    parser = argparse.ArgumentParser(description="Download data from Google Cloud Storage")
+    parser.add_argument("--verify", action="store_true",
+                        help="Compare MD5 checksums before skipping files that are already present")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Download with asyncio (gcloud-aio-storage), faster for many small files")
+    args = parser.parse_args()
+
     # Get GCS path from environment variable
     gcs_path = os.environ.get('GCS_DATA_PATH')
 
@@ -158,8 +532,8 @@ def main():
         return
 
     # Download the data
-    download_gcs_directory(gcs_path)
+    download_gcs_directory(gcs_path, verify=args.verify, use_async=args.use_async)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -36,7 +36,7 @@ def create_vertex_ai_job(
     labels: Optional[dict] = None,
     container_image_uri: Optional[str] = None,
     args: Optional[list] = None,
-    env: Optional[list] = None,
+    env: Optional[dict] = None,
     gcs_data_path: Optional[str] = None,
 ):
     """
@@ -54,7 +54,7 @@ def create_vertex_ai_job(
         labels: Dictionary of labels to attach to the job
         container_image_uri: Container image URI
         args: Arguments to pass to the training script
-        env: Environment variables
+        env: Environment variables as a name -> value dict
         gcs_data_path: GCS path to dataset
     """
 
@@ -72,10 +72,11 @@ def create_vertex_ai_job(
         accelerator_count=accelerator_count,
     )
 
-    # Build environment variables
-    env_vars = env or []
+    # Build environment variables (copy, so the caller's dict is not modified)
+    env = dict(env or {})
     if gcs_data_path:
-        env_vars.append(EnvVar(name="GCS_DATA_PATH", value=gcs_data_path))
+        env["GCS_DATA_PATH"] = gcs_data_path
+    env_vars = [EnvVar(name=name, value=value) for name, value in env.items()]
 
     # Configure container spec
     container_spec = ContainerSpec(
@@ -127,9 +128,9 @@ def main():
     wandb_key = os.getenv("WANDB_API_KEY", config.get("wandb_api_key"))
 
     # Build environment variables
-    env_vars = []
+    env = {}
     if wandb_key:
-        env_vars.append(EnvVar(name="WANDB_API_KEY", value=wandb_key))
+        env["WANDB_API_KEY"] = wandb_key
         print("✓ WandB API key configured")
 
     # Check for container image
@@ -176,7 +177,7 @@ def main():
             container_image_uri=config["container_image_uri"],
             labels=config.get("labels", {}),
             args=training_args,
-            env=env_vars,
+            env=env,
             gcs_data_path=config.get("gcs_data_path"),
         )
 